@@ -2,19 +2,19 @@ import numpy as np
 from phase_portrait import InitialCondition, PhasePortrait
 
 
-def system(t, state):
+def system(t, state, dstate):
     """
     Defines a system of differential equations.
 
     Args:
         t (float): Time variable (not used in the computation but required for ODE solvers).
-        state (list of float): A list containing state variables [x, y].
-
-    Returns:
-        list of float: The derivatives [dx/dt, dy/dt] of the system.
+        state (array of float): State variables [x, y], each an array holding
+            one value per trajectory.
+        dstate (array of float): Output array for the derivatives [dx/dt, dy/dt].
     """
     x, y = state
-    return [y, -x - y + x**2 + y**2]
+    dstate[0] = y
+    dstate[1] = -x - y + x * x + y * y
 
 
 initial_conditions_list = [
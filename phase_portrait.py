@@ -1,8 +1,12 @@
 import os
+import re
 from typing import List, Optional, Union, TypedDict
+import numpy as np
 import matplotlib.pyplot as plt
-from scipy.integrate import solve_ivp
+from matplotlib.collections import LineCollection
+from integrator import METHODS, make_integrator
 
+ARROW_SIZE = 0.14  # inches
 
 DEFAULT_CONFIG = {
     "arrow_span": 20,
@@ -10,6 +14,42 @@ DEFAULT_CONFIG = {
 }
 
 
+def _rdp(points, tolerance):
+    """
+    Simplify a polyline with the Ramer–Douglas–Peucker algorithm.
+
+    Args:
+        points: Array of shape (T, 2) with the vertices of the polyline.
+        tolerance: Largest allowed distance of a dropped vertex to the
+            simplified polyline.
+
+    Returns:
+        Array with the kept vertices, the end points are always kept.
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a = points[start]
+        d = points[end] - a
+        inner = points[start + 1 : end] - a
+        norm = np.hypot(d[0], d[1])
+        if norm == 0:
+            dist = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            dist = np.abs(d[0] * inner[:, 1] - d[1] * inner[:, 0]) / norm
+        k = np.argmax(dist)
+        if dist[k] > tolerance:
+            k += start + 1
+            keep[k] = True
+            stack.append((start, k))
+            stack.append((k, end))
+    return points[keep]
+
+
 class PlotConfig(TypedDict, total=False):
     arrow_span: int
     number_of_arrow: int
@@ -20,8 +60,9 @@ class InitialCondition:
         self,
         point,
         t_eval=None,
-        rtol=1e-6,
+        rtol=1e-8,
         atol=1e-10,
+        method="DOP853",
         color="black",
         arrow_color="black",
         config: Optional[Union[PlotConfig, List[PlotConfig]]] = None,
@@ -30,6 +71,9 @@ class InitialCondition:
         self.t_eval = t_eval
         self.rtol = rtol
         self.atol = atol
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {list(METHODS)}")
+        self.method = method
         self.color = color
         self.arrow_color = arrow_color
         if config is None:
@@ -38,15 +82,36 @@ class InitialCondition:
 
 
 class PhasePortrait:
-    def __init__(self, system):
+    def __init__(self, system, figsize=None):
         """
         Initialize the PhasePortrait object.
 
+        The figure is created lazily on the first plot.
+
         Args:
-            system: Callable that describes the system of differential equations.
+            system: Function system(t, state, dstate) that describes the
+                system of differential equations. state and dstate have shape
+                (dim, N) and hold the states of N trajectories at once. It is
+                compiled with numba once per process, the integration kernel
+                itself is kept in numba's on-disk cache.
+            figsize: Figure size (width, height) in inches, matplotlib default
+                if None.
         """
         self.system = system
-        self.fig, self.ax = plt.subplots()
+        self._next_index = {}
+        self.figsize = figsize
+        self.fig = self.ax = None
+
+    def _ensure_axes(self):
+        if self.ax is None:
+            self.fig, self.ax = plt.subplots(figsize=self.figsize)
+
+    def reset(self):
+        """
+        Clear the plotted phase portrait, keeping the figure for reuse.
+        """
+        if self.ax is not None:
+            self.ax.clear()
 
     def plot_trajectory(
         self,
@@ -56,48 +121,83 @@ class PhasePortrait:
         arrow_color="black",
         number_of_arrow=1,
         t_eval=None,
+        rasterized=False,
     ):
         """
         Plot the solution trajectory with optional arrows to indicate direction.
 
         Args:
-            solution: Array of x and y solutions from solve_ivp.
+            solution: Array of x and y solutions from the integrator.
             color: Line color of the trajectory.
             arrow_span: Interval between arrows along the trajectory.
             arrow_color: Color of the arrows.
             number_of_arrow: Number of arrows
+            rasterized: Whether to rasterize the line in vector output.
         """
+        self._ensure_axes()
+
         is_reverse = False
         if not t_eval is None and t_eval[0] > t_eval[-1]:
             is_reverse = True
 
         x, y = solution
-        self.ax.plot(x, y, color=color)
-
-        idx = arrow_span
-        for _ in range(number_of_arrow):
-            xy = (x[idx], y[idx])
-            xytext = (x[idx - 2], y[idx - 2])
-
-            if is_reverse:
-                temp = xy
-                xy = xytext
-                xytext = temp
-
-            if idx >= len(x):
-                continue
-            self.ax.annotate(
-                "",
-                xy=xy,
-                xytext=xytext,
-                arrowprops={
-                    "arrowstyle": "-|>",
-                    "color": arrow_color,
-                    "lw": 1.2,
-                    "mutation_scale": 20,
-                },
-            )
-            idx += arrow_span
+        self.ax.plot(x, y, color=color, rasterized=rasterized)
+        arrows = self._arrows(x, y, arrow_span, number_of_arrow, is_reverse)
+        self._plot_arrows([arrows], [arrow_color] * len(arrows))
+
+    @staticmethod
+    def _arrows(x, y, arrow_span, number_of_arrow, is_reverse):
+        """
+        Tip positions and directions of the arrows of a trajectory.
+
+        The arrows sit every arrow_span points and point along the trajectory,
+        i.e. backwards along the samples for reverse time. Arrows that would
+        fall past the end of a (possibly truncated) trajectory are left out.
+
+        Returns:
+            Array of shape (number of arrows, 4) with rows (x, y, dx, dy).
+        """
+        if arrow_span < 1:
+            raise ValueError("arrow_span must be at least 1")
+        n_arrows = max(0, min(number_of_arrow, (len(x) - 1) // arrow_span))
+        idx = arrow_span * np.arange(1, n_arrows + 1)
+        idx = idx[idx >= 2]
+        tip, tail = idx, idx - 2
+        if is_reverse:
+            tip, tail = tail, idx
+        return np.column_stack((x[tip], y[tip], x[tip] - x[tail], y[tip] - y[tail]))
+
+    def _plot_arrows(self, arrows, colors):
+        """
+        Draw arrowheads of a fixed size with a single quiver call.
+
+        Args:
+            arrows: List of arrays with rows (x, y, dx, dy), as returned by
+                _arrows.
+            colors: Color of each arrow.
+        """
+        if not colors:
+            return
+        x, y, dx, dy = np.concatenate(arrows).T
+        length = np.hypot(dx, dy)
+        length[length == 0] = 1
+        self.ax.quiver(
+            x,
+            y,
+            dx / length,
+            dy / length,
+            color=colors,
+            angles="xy",
+            pivot="tip",
+            units="inches",
+            scale_units="inches",
+            scale=1 / ARROW_SIZE,
+            width=ARROW_SIZE / 12,
+            headwidth=10,
+            headlength=12,
+            headaxislength=12,
+            zorder=2,
+        )
 
     def plot_equilibrium(self, coordinates, is_stable=False):
         """
@@ -107,6 +207,7 @@ class PhasePortrait:
             coordinates: Tuple of coordinates (x, y).
             is_stable: Whether the equilibrium point is stable.
         """
+        self._ensure_axes()
         color = "green" if is_stable else "red"
         self.ax.scatter(coordinates[0], coordinates[1], color=color, s=50, zorder=2)
 
@@ -114,6 +215,8 @@ class PhasePortrait:
         self,
         initial_conditions_list: List[InitialCondition],
         t_eval=None,
+        rasterized=False,
+        simplify_tolerance=None,
     ):
         """
         Visualize the trajectories for a list of initial conditions.
@@ -122,8 +225,17 @@ class PhasePortrait:
             initial_conditions_list: List of initial conditions [[x0, v0], ...].
             t_span: Tuple (t_start, t_end) specifying the time interval for integration.
             t_eval: List of time evaluation points for each trajectory.
+            rasterized: Whether to rasterize the trajectory lines in vector
+                output. Keeps the PDF small and fast to render when plotting
+                hundreds of trajectories, equilibria and arrows stay vector.
+            simplify_tolerance: If given, drop points of the trajectory lines
+                that deviate less than this distance (in data units) from the
+                simplified line. matplotlib already simplifies paths at draw
+                time, this additionally cuts the data handed to it. Arrows are
+                placed on the full-resolution trajectories.
         """
-        for initial_condition in initial_conditions_list:
+        batches = {}
+        for i, initial_condition in enumerate(initial_conditions_list):
 
             if t_eval is None and initial_condition.t_eval is None:
                 raise ValueError("Need to provide t_eval value")
@@ -131,24 +243,72 @@ class PhasePortrait:
             if initial_condition.t_eval is None:
                 initial_condition.t_eval = t_eval
 
-            sol = solve_ivp(
-                self.system,
-                y0=initial_condition.point,
-                t_span=[initial_condition.t_eval[0], initial_condition.t_eval[-1]],
-                t_eval=initial_condition.t_eval,
-                rtol=initial_condition.rtol,
-                atol=initial_condition.atol,
-                method="RK45",
+            t_eval_i = np.asarray(initial_condition.t_eval, dtype=np.float64)
+            steps = np.diff(t_eval_i)
+            if not (np.all(steps > 0) or np.all(steps < 0)):
+                raise ValueError("Values in t_eval are not properly sorted")
+
+            key = (initial_condition.method, t_eval_i.tobytes())
+            batches.setdefault(key, []).append(i)
+
+        solutions = [None] * len(initial_conditions_list)
+        for (method, _), indices in batches.items():
+            batch = [initial_conditions_list[i] for i in indices]
+            y, n_valid = make_integrator(self.system, method)(
+                np.array([ic.point for ic in batch], dtype=np.float64),
+                np.asarray(batch[0].t_eval, dtype=np.float64),
+                np.array([ic.rtol for ic in batch], dtype=np.float64),
+                np.array([ic.atol for ic in batch], dtype=np.float64),
             )
+            for i, y_i, n in zip(indices, y, n_valid):
+                solutions[i] = y_i[:n]
+
+        # All trajectories go into a single artist, all arrows into another.
+        self._ensure_axes()
+        segments = solutions
+        if simplify_tolerance is not None:
+            segments = [_rdp(solution, simplify_tolerance) for solution in solutions]
+        lines = LineCollection(
+            segments,
+            colors=[ic.color for ic in initial_conditions_list],
+            linewidths=plt.rcParams["lines.linewidth"],
+            rasterized=rasterized,
+        )
+        self.ax.add_collection(lines)
+        self.ax.autoscale_view()
 
-            self.plot_trajectory(
-                solution=[sol.y[0], sol.y[1]],
-                color=initial_condition.color,
-                arrow_span=initial_condition.config["arrow_span"],
-                arrow_color=initial_condition.arrow_color,
-                number_of_arrow=initial_condition.config["number_of_arrow"],
-                t_eval=initial_condition.t_eval,
+        # Per-trajectory settings gathered once, indexed by position below.
+        n = len(initial_conditions_list)
+        arrow_spans = np.fromiter(
+            (ic.config["arrow_span"] for ic in initial_conditions_list),
+            dtype=np.int64,
+            count=n,
+        )
+        numbers_of_arrows = np.fromiter(
+            (ic.config["number_of_arrow"] for ic in initial_conditions_list),
+            dtype=np.int64,
+            count=n,
+        )
+        is_reverse = np.fromiter(
+            (ic.t_eval[0] > ic.t_eval[-1] for ic in initial_conditions_list),
+            dtype=bool,
+            count=n,
+        )
+        arrows = []
+        arrow_colors = []
+        for i, (initial_condition, solution) in enumerate(
+            zip(initial_conditions_list, solutions)
+        ):
+            arrows_i = self._arrows(
+                solution[:, 0],
+                solution[:, 1],
+                arrow_span=arrow_spans[i],
+                number_of_arrow=numbers_of_arrows[i],
+                is_reverse=is_reverse[i],
             )
+            arrows.append(arrows_i)
+            arrow_colors.extend([initial_condition.arrow_color] * len(arrows_i))
+        self._plot_arrows(arrows, arrow_colors)
 
     def show(self, xlabel="x", ylabel="y", title="Phase Portrait", axis=None):
         """
@@ -160,6 +320,7 @@ class PhasePortrait:
             title: Title of the plot.
             axis: Iterable object of (x_min, x_max, y_min, y_max) to set axis limits.
         """
+        self._ensure_axes()
         self.ax.set_title(title)
 
         self.ax.set_xlabel(xlabel, fontsize=16)
@@ -176,24 +337,36 @@ class PhasePortrait:
         self.ax.legend()
         plt.show()
 
-    def save(self, path=None):
+    def save(self, path=None, dpi=300):
         """
         Save the plotted phase portrait to a file.
 
+        The figure is closed afterwards, further plots start a new figure.
+
         Args:
             path: Directory where the plot will be saved. Defaults to "images".
+            dpi: Resolution of the rasterized parts of the figure.
         """
         if path is None:
             path = "images"
         if not os.path.exists(path):
             os.makedirs(path)
-        file_count = len(
-            [
-                name
-                for name in os.listdir(path)
-                if name.startswith("plot_") and name.endswith(".pdf")
-            ]
-        )
-        image_path = os.path.join(path, f"plot_{file_count + 1}.pdf")
-        self.fig.savefig(image_path, dpi=300)
+        if path not in self._next_index:
+            # Scan the directory once, later saves continue the numbering.
+            matches = (
+                re.fullmatch(r"plot_(\d+)\.pdf", name) for name in os.listdir(path)
+            )
+            self._next_index[path] = (
+                max((int(match.group(1)) for match in matches if match), default=0) + 1
+            )
+        image_path = os.path.join(path, f"plot_{self._next_index[path]}.pdf")
+        # Something else may have saved into the directory since the scan.
+        while os.path.exists(image_path):
+            self._next_index[path] += 1
+            image_path = os.path.join(path, f"plot_{self._next_index[path]}.pdf")
+        self._ensure_axes()
+        self.fig.savefig(image_path, dpi=dpi)
+        self._next_index[path] += 1
+        plt.close(self.fig)
+        self.fig = self.ax = None
         print(f"Figure saved to {image_path}")
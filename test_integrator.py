@@ -0,0 +1,224 @@
+import os
+import tempfile
+import unittest
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+from scipy.integrate import solve_ivp
+from integrator import METHODS, make_integrator
+from phase_portrait import InitialCondition, PhasePortrait, _rdp
+
+
+def system(t, state, dstate):
+    x, y = state
+    dstate[0] = y
+    dstate[1] = -x - y + x * x + y * y
+
+
+def system_ivp(t, state):
+    x, y = state
+    return [y, -x - y + x * x + y * y]
+
+
+# The initial conditions of main.py, the last one integrated backwards.
+FORWARD = [
+    [0.5, -1.5],
+    [-0.3, -1.5],
+    [-0.409, -1.5],
+    [0.9, -1.5],
+    [-0.49, -1.5],
+    [1.5, -1.5],
+    [1.64, -1.5],
+    [1.9, -1.5],
+]
+REVERSE = [[1, 0.5]]
+
+
+class TestIntegrator(unittest.TestCase):
+    def check_against_solve_ivp(
+        self, method, points, t_eval, tolerance=1e-6, escape_tolerance=1e-3
+    ):
+        """
+        Compare the batch with solve_ivp at the same tolerances. tolerance
+        bounds the difference on trajectories reaching the end of t_eval,
+        escape_tolerance (relative) on those escaping to infinity, whose
+        values grow large near the cut-off.
+        """
+        rtol, atol = 1e-8, 1e-10
+        n = len(points)
+        y, n_valid = make_integrator(system, method)(
+            np.array(points, dtype=np.float64),
+            t_eval,
+            np.full(n, rtol),
+            np.full(n, atol),
+        )
+        for point, y_i, n_i in zip(points, y, n_valid):
+            with self.subTest(method=method, point=point):
+                expected = solve_ivp(
+                    system_ivp,
+                    (t_eval[0], t_eval[-1]),
+                    point,
+                    method=method,
+                    t_eval=t_eval,
+                    rtol=rtol,
+                    atol=atol,
+                )
+                # Trajectories escaping to infinity are cut off where
+                # solve_ivp gives up.
+                self.assertEqual(n_i, expected.y.shape[1])
+                if expected.status == 0:
+                    np.testing.assert_allclose(
+                        y_i[:n_i], expected.y.T, rtol=tolerance, atol=tolerance
+                    )
+                else:
+                    np.testing.assert_allclose(
+                        y_i[:n_i], expected.y.T, rtol=escape_tolerance, atol=1e-6
+                    )
+
+    def test_forward(self):
+        for method in METHODS:
+            self.check_against_solve_ivp(method, FORWARD, np.linspace(0, 50, 1500))
+
+    def test_reverse(self):
+        for method in METHODS:
+            self.check_against_solve_ivp(method, REVERSE, np.linspace(50, 0, 1500))
+
+    def test_single_trajectory(self):
+        # Alone in its batch a trajectory takes the same steps as solve_ivp,
+        # only rounding differs.
+        for method in METHODS:
+            for point in ([0.5, -1.5], [1.9, -1.5]):
+                self.check_against_solve_ivp(
+                    method,
+                    [point],
+                    np.linspace(0, 50, 1500),
+                    tolerance=1e-11,
+                    escape_tolerance=1e-10,
+                )
+
+    def test_unsorted_t_eval(self):
+        phase_portrait = PhasePortrait(system)
+        with self.assertRaises(ValueError):
+            phase_portrait.plot_trajectories(
+                [InitialCondition([0.5, -1.5])], t_eval=[0, 5, 2, 10]
+            )
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            InitialCondition([0.5, -1.5], method="Euler")
+
+
+class TestArrows(unittest.TestCase):
+    def test_truncated_trajectory(self):
+        # Escapes to infinity after 79 of the 1500 samples.
+        phase_portrait = PhasePortrait(system)
+        phase_portrait.plot_trajectories(
+            [
+                InitialCondition(
+                    [1.9, -1.5], config={"arrow_span": 200, "number_of_arrow": 50}
+                )
+            ],
+            t_eval=np.linspace(0, 50, 1500),
+        )
+
+    def test_span_of_one(self):
+        x = np.arange(5.0)
+        arrows = PhasePortrait._arrows(x, 2 * x, 1, 10, False)
+        np.testing.assert_array_equal(
+            arrows, [[2, 4, 2, 4], [3, 6, 2, 4], [4, 8, 2, 4]]
+        )
+
+    def test_single_point(self):
+        arrows = PhasePortrait._arrows(np.zeros(1), np.zeros(1), 20, 5, False)
+        self.assertEqual(arrows.shape, (0, 4))
+
+    def test_reverse_time(self):
+        x = np.arange(50.0)
+        arrows = PhasePortrait._arrows(x, 2 * x, 20, 5, True)
+        np.testing.assert_array_equal(arrows, [[18, 36, -2, -4], [38, 76, -2, -4]])
+
+    def test_span_below_one(self):
+        with self.assertRaises(ValueError):
+            PhasePortrait._arrows(np.arange(5.0), np.arange(5.0), 0, 1, False)
+
+
+def distance_to_polyline(point, polyline):
+    """
+    Distance of a point to the nearest segment of a polyline.
+    """
+    a = polyline[:-1]
+    d = polyline[1:] - a
+    length2 = np.sum(d * d, axis=1)
+    s = np.sum((point - a) * d, axis=1) / np.where(length2 == 0, 1, length2)
+    nearest = a + np.clip(s, 0, 1)[:, None] * d
+    return np.min(np.hypot(*(point - nearest).T))
+
+
+class TestRdp(unittest.TestCase):
+    def check_within_tolerance(self, points, tolerance):
+        simplified = _rdp(points, tolerance)
+        np.testing.assert_array_equal(simplified[0], points[0])
+        np.testing.assert_array_equal(simplified[-1], points[-1])
+        for point in points:
+            self.assertLessEqual(
+                distance_to_polyline(point, simplified), tolerance + 1e-12
+            )
+        return simplified
+
+    def test_collinear(self):
+        points = np.column_stack((np.linspace(0, 1, 50), np.linspace(0, 2, 50)))
+        self.assertEqual(len(self.check_within_tolerance(points, 1e-9)), 2)
+
+    def test_spiral(self):
+        t = np.linspace(0, 6 * np.pi, 1000)
+        points = np.column_stack(
+            (np.exp(-t / 5) * np.cos(t), np.exp(-t / 5) * np.sin(t))
+        )
+        simplified = self.check_within_tolerance(points, 1e-3)
+        self.assertLess(len(simplified), len(points) // 2)
+
+    def test_closed_loop(self):
+        # First and last vertex coincide, distances are taken to that point.
+        t = np.linspace(0, 2 * np.pi, 200)
+        points = np.column_stack((np.cos(t), np.sin(t)))
+        points[-1] = points[0]
+        simplified = self.check_within_tolerance(points, 1e-2)
+        self.assertGreater(len(simplified), 2)
+
+
+class TestSave(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        for name in ("plot_1.pdf", "plot_7.pdf", "notes.txt"):
+            with open(os.path.join(self.path, name), "w") as file:
+                file.write(name)
+
+    def save(self, phase_portrait):
+        phase_portrait.plot_equilibrium((0, 0))
+        phase_portrait.save(self.path)
+
+    def test_continues_after_highest_index(self):
+        self.save(PhasePortrait(system))
+        self.assertTrue(os.path.exists(os.path.join(self.path, "plot_8.pdf")))
+
+    def test_skips_files_created_since_scan(self):
+        phase_portrait = PhasePortrait(system)
+        self.save(phase_portrait)
+        # Another writer takes the next name after the directory was scanned.
+        taken = os.path.join(self.path, "plot_9.pdf")
+        with open(taken, "w") as file:
+            file.write("taken")
+
+        self.save(phase_portrait)
+
+        with open(taken) as file:
+            self.assertEqual(file.read(), "taken")
+        self.assertTrue(os.path.exists(os.path.join(self.path, "plot_10.pdf")))
+
+
+if __name__ == "__main__":
+    unittest.main()